@@ -1,14 +1,26 @@
+import asyncio
 import hashlib
 import os
 import re
-from urllib.parse import urljoin
+import time
+from datetime import datetime
+from functools import lru_cache, partial
+from html import unescape
+from pathlib import Path
+from urllib.parse import parse_qsl, urldefrag, urlencode, urljoin, urlparse, urlunparse
 
-from bs4 import BeautifulSoup
+from curl_cffi import CurlHttpVersion, CurlOpt
+from curl_cffi.requests import AsyncSession, RequestsError
 from dateutil import tz
-import dateparser
-from ics import Calendar, Event
-from ics.grammar.parse import ContentLine
-from playwright.sync_api import sync_playwright
+from dateparser.date import DateDataParser
+from playwright.async_api import Error as PlaywrightError, TimeoutError as PlaywrightTimeoutError, async_playwright
+
+# selectolax (lexbor) parsea y resuelve selectores CSS en C; bs4 queda como fallback
+try:
+    from selectolax.lexbor import LexborHTMLParser
+except ImportError:
+    LexborHTMLParser = None
+    from bs4 import BeautifulSoup
 
 AGENDA_URL = "https://palausantjordi.barcelona/es/agenda"
 DEFAULT_TZ = tz.gettz("Europe/Madrid")
@@ -16,13 +28,62 @@ DEFAULT_TIME = (20, 0)  # 20:00 si no hay hora
 OUTPUT_DIR = os.path.join("public")
 OUTPUT_PATH = os.path.join(OUTPUT_DIR, "events.ics")
 CAL_NAME = "Agenda Palau Sant Jordi"
+ICS_DT_FORMAT = "%Y%m%dT%H%M%SZ"  # UTC
+UID_SUFFIX = "@palausantjordi"
+# Caché en disco del HTML descargado (fuera de public/ para no publicarla)
+CACHE_DIR = ".cache"
+CACHE_TTL = int(os.environ.get("SCRAPER_CACHE_TTL", 6 * 3600))  # segundos
+# Cookies/consentimiento de Chromium entre ejecuciones
+STATE_PATH = os.path.join(CACHE_DIR, "state.json")
+# Marca de que la sesión guardada incluye la cookie de consentimiento
+CONSENT_PATH = os.path.join(CACHE_DIR, "consent")
+CONSENT_BUTTON = "Aceptar todas"
 
 # Páginas a recorrer del listado
 MAX_PAGES = 4
+# Contextos de Chromium (una pestaña reutilizada cada uno) trabajando en paralelo
+CONCURRENCY = 4
+# Recursos que Chromium no necesita descargar ("other" no: puede ser la
+# petición que trae los datos del listado)
+BLOCKED_RESOURCES = frozenset({"image", "stylesheet", "font", "media", "websocket", "texttrack", "manifest"})
+BLOCKED_ASSETS_GLOB = "**/*.{png,jpg,jpeg,gif,webp,svg,css,woff,woff2,ttf,mp4}"
+# Huella TLS/HTTP que imita curl_cffi en las descargas estáticas
+IMPERSONATE = "chrome124"
+
+# Selectores CSS compartidos por todas las páginas del listado
+CARD_SELECTOR = "article, .views-row, .event, .node--type-event, .card, .node, .teaser"
+LINK_SELECTOR = "a[href]"
+# Nodos sin texto visible (JSON-LD, JS inline...): fuera antes de leer tarjetas
+HIDDEN_TAGS = ["script", "style", "noscript", "template"]
+# Enlaces del paginador, directamente sobre el HTML crudo (sin parsear)
+PAGER_REGEX = re.compile(r"""href=["']([^"']*\?page=[^"']*)["']""", re.IGNORECASE)
+# Marcas en el HTML crudo de que el listado viene ya renderizado (no
+# "<article": los temas envuelven la propia página en uno)
+CARD_MARKERS = ("views-row", "node--type-event")
+
+# Un único parser en español reutilizado (sin autodetección de idioma)
+DATE_PARSER = DateDataParser(
+    languages=["es"],
+    settings={
+        "TIMEZONE": "Europe/Madrid",
+        "RETURN_AS_TIMEZONE_AWARE": True,
+        "PREFER_DATES_FROM": "future",
+    },
+)
 
 # Regex útiles para fallback de fecha/hora
 DATE_REGEX = re.compile(r"(\d{1,2})\s+de\s+([A-Za-záéíóúñÁÉÍÓÚÑ]+)\s+de\s+(\d{4})", re.IGNORECASE)
 TIME_REGEX = re.compile(r"(\d{1,2}):(\d{2})")
+# Algo con pinta de fecha ("20 de octubre", "20 oct", "20/10/2025", ISO);
+# sin esto no merece la pena llamar a dateparser
+DATE_HINT_REGEX = re.compile(
+    r"\b\d{1,2}\s+(?:de\s+)?(?:ene|feb|mar|abr|may|jun|jul|ago|sep|set|oct|nov|dic)"
+    r"|\b\d{1,2}[/.-]\d{1,2}[/.-]\d{2,4}\b"
+    r"|\b\d{4}-\d{2}-\d{2}",
+    re.IGNORECASE,
+)
+WS_REGEX = re.compile(r"\s+")
+LETTER_REGEX = re.compile(r"[A-Za-zÁÉÍÓÚáéíóúÜüÑñ]")
 MONTHS_ES = {
     "enero":1,"febrero":2,"marzo":3,"abril":4,"mayo":5,"junio":6,
     "julio":7,"agosto":8,"septiembre":9,"setiembre":9,"octubre":10,
@@ -30,59 +91,223 @@ MONTHS_ES = {
 }
 
 # Palabras a ignorar cuando buscamos el título en las tarjetas
-NOISE_PREFIXES = {"+ info", "+info", "comprar tickets", "entradas", "gratut", "gratis", "image", "ticket", "agotadas"}
-VENUE_WORDS = {"palau sant jordi", "sant jordi club", "estadi olímpic", "estadi olimpic", "olímpic", "olimpic"}
+# (tuplas: orden fijo en las regex compiladas, sin depender del hash de str)
+NOISE_PREFIXES = ("+ info", "+info", "comprar tickets", "entradas", "gratut", "gratis", "image", "ticket", "agotadas")
+VENUE_WORDS = ("palau sant jordi", "sant jordi club", "estadi olímpic", "estadi olimpic", "olímpic", "olimpic")
+COOKIE_WORDS = ("aceptar todas", "personalizar", "rechazar", "uso de cookies")
+# Una sola pasada de `re` (en C) en lugar de bucles any(...) por línea
+NOISE_REGEX = re.compile(
+    r"^(?:" + "|".join(map(re.escape, NOISE_PREFIXES)) + r")|" + "|".join(map(re.escape, COOKIE_WORDS)),
+    re.IGNORECASE,
+)
+VENUE_REGEX = re.compile("|".join(map(re.escape, VENUE_WORDS)), re.IGNORECASE)
 
 # -----------------------
 # Playwright
 # -----------------------
 class Browser:
-    def __enter__(self):
-        self._p = sync_playwright().start()
-        self.browser = self._p.chromium.launch(headless=True)
-        self.context = self.browser.new_context(user_agent=(
-            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-            "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
-        ))
-        # Bloquear imágenes, CSS, fuentes, media (más rápido)
-        def _route(route):
-            if route.request.resource_type in ("image", "stylesheet", "font", "media"):
-                return route.abort()
-            return route.continue_()
-        self.context.route("**/*", _route)
-        self.page = self.context.new_page()
-        self.page.set_default_navigation_timeout(60_000)
+    # Chromium se arranca solo cuando alguna página necesita renderizarse
+    async def __aenter__(self):
+        self._p = None
+        self._start_lock = asyncio.Lock()
         return self
 
-    def __exit__(self, exc_type, exc, tb):
+    async def _start(self):
+        # self._p solo se asigna con todo listo: si el arranque falla, __aexit__
+        # no toca nada a medias y el siguiente get_html lo reintenta
+        p = await async_playwright().start()
+        try:
+            await self._launch(p)
+        except BaseException:
+            await p.stop()
+            raise
+        self._p = p
+
+    async def _launch(self, p):
+        self.browser = await p.chromium.launch(headless=True)
+        # la sesión guardada se carga siempre; el consentimiento va aparte
+        self._state_file = STATE_PATH if os.path.exists(STATE_PATH) else None
+        self._consented = self._state_file is not None and os.path.exists(CONSENT_PATH)
+        # un intento de aceptar el banner por ejecución
+        self._consent_tried = self._consented
+        # un contexto (ligero, comparte proceso) con su pestaña por cada worker
+        self.contexts = [await self._new_context() for _ in range(CONCURRENCY)]
+        # sesión que se guarda al salir: la que acepte el banner, o la primera
+        self._state_context = self.contexts[0]
+        # pool de pestañas: cada descarga toma una libre y la devuelve al terminar
+        self._pages = asyncio.Queue()
+        for context in self.contexts:
+            self._pages.put_nowait(await context.new_page())
+
+    async def _new_context(self):
+        context = await self.browser.new_context(
+            user_agent=(
+                "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/123.0.0.0 Safari/537.36"
+            ),
+            storage_state=self._state_file,
+        )
+        # Bloquear imágenes, CSS, fuentes, media, websockets... (más rápido)
+        async def _route(route):
+            await (route.abort if route.request.resource_type in BLOCKED_RESOURCES else route.continue_)()
+        await context.route("**/*", _route)
+        # registrada después, tiene prioridad: los estáticos se abortan sin pasar por _route
+        await context.route(BLOCKED_ASSETS_GLOB, lambda route: route.abort())
+        context.set_default_navigation_timeout(15_000)
+        return context
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self._p is None:
+            return
         try:
-            self.context.close(); self.browser.close(); self._p.stop()
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            await self._state_context.storage_state(path=STATE_PATH)
+            # la marca solo acompaña a una sesión que tiene el consentimiento
+            if self._consented:
+                Path(CONSENT_PATH).touch()
+            elif os.path.exists(CONSENT_PATH):
+                os.remove(CONSENT_PATH)
         except Exception:
             pass
-
-    def get_html(self, url: str) -> str:
-        self.page.goto(url, wait_until="networkidle")
-        # esperar a que el listado esté renderizado
         try:
-            self.page.wait_for_selector("article, .views-row, .event, .node--type-event, .card, .node, .teaser", timeout=60000)
+            for context in self.contexts:
+                await context.close()
+            await self.browser.close(); await self._p.stop()
         except Exception:
-            print(f"⚠️ No se encontraron tarjetas en {url}")
-        return self.page.content()
+            pass
+
+    async def get_html(self, url: str) -> str:
+        async with self._start_lock:
+            if self._p is None:
+                await self._start()
+        page = await self._pages.get()
+        try:
+            # no esperar a networkidle: basta con el DOM y la primera tarjeta
+            await page.goto(url, wait_until="domcontentloaded")
+            try:
+                await page.wait_for_selector(CARD_SELECTOR, state="attached", timeout=10_000)
+            except PlaywrightTimeoutError:
+                print(f"⚠️ No se encontraron tarjetas en {url}")
+            if not self._consent_tried:
+                # solo la primera vez; si se acepta, la cookie queda en STATE_PATH
+                self._consent_tried = True
+                await self._accept_consent(page)
+            return await page.content()
+        finally:
+            self._pages.put_nowait(page)
+
+    async def _accept_consent(self, page):
+        # sin esperas: si el banner no está ya visible (no existe, ha cambiado
+        # de texto, va en un iframe...) no se pierde tiempo
+        button = page.get_by_role("button", name=CONSENT_BUTTON).first
+        try:
+            if not await button.is_visible():
+                return
+            await button.click(timeout=2_000)
+        except PlaywrightError:
+            return
+        self._consented = True
+        self._state_context = page.context
+
+# -----------------------
+# Descarga estática (curl_cffi)
+# -----------------------
+async def fetch_static(client: AsyncSession, url: str) -> str | None:
+    try:
+        r = await client.get(url)
+    except RequestsError as e:
+        print(f"⚠️ Error descargando {url}: {e}")
+        return None
+    if r.status_code != 200:
+        return None
+    return r.text
+
+def has_cards(html: str) -> bool:
+    return any(m in html for m in CARD_MARKERS)
+
+def static_session() -> AsyncSession:
+    # todo es del mismo origen: HTTP/2 multiplexa las descargas sobre una
+    # sola conexión TLS que se reutiliza durante toda la ejecución
+    return AsyncSession(
+        impersonate=IMPERSONATE,
+        http_version=CurlHttpVersion.V2TLS,
+        max_clients=CONCURRENCY,
+        timeout=(5, 15),  # (conexión, lectura)
+        # una sola resolución DNS por ejecución (por defecto libcurl la
+        # descarta a los 60 s); la caché es compartida por toda la sesión
+        curl_options={CurlOpt.DNS_CACHE_TIMEOUT: 300},
+    )
+
+async def fetch_listing(client: AsyncSession, session: Browser, url: str) -> str:
+    # HTML estático si ya trae las tarjetas; si no, renderizado con Chromium
+    html = await fetch_static(client, url)
+    if html and has_cards(html):
+        return html
+    return await session.get_html(url)
+
+async def cached_get(url: str, fetch_fn, ttl: int = CACHE_TTL) -> str:
+    path = os.path.join(CACHE_DIR, hashlib.sha1(url.encode("utf-8")).hexdigest() + ".html")
+    if os.path.exists(path) and time.time() - os.path.getmtime(path) < ttl:
+        with open(path, encoding="utf-8") as f:
+            return f.read()
+    html = await fetch_fn(url)
+    # solo se guardan páginas con tarjetas, para no fijar un error en caché
+    if has_cards(html):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(html)
+    return html
+
+# -----------------------
+# HTML (selectolax o bs4)
+# -----------------------
+def parse_html(html: str):
+    if LexborHTMLParser is not None:
+        tree = LexborHTMLParser(html)
+        tree.strip_tags(HIDDEN_TAGS)
+        return tree
+    soup = BeautifulSoup(html, "lxml")
+    for node in soup(HIDDEN_TAGS):
+        node.decompose()
+    return soup
+
+def select(node, selector: str) -> list:
+    if LexborHTMLParser is not None:
+        return node.css(selector)
+    return node.select(selector)
+
+def select_first(node, selector: str):
+    if LexborHTMLParser is not None:
+        return node.css_first(selector)
+    return node.select_one(selector)
+
+def node_lines(node) -> list[str]:
+    if LexborHTMLParser is None:
+        return list(node.stripped_strings)
+    text = node.text(separator="\n", strip=True)
+    return [t for t in (s.strip() for s in text.splitlines()) if t]
+
+def node_attr(node, name: str) -> str | None:
+    if LexborHTMLParser is not None:
+        return node.attributes.get(name)
+    return node.get(name)
 
 # -----------------------
 # Utilidades
 # -----------------------
 def extract_datetime_es(text: str):
-    if not text:
+    m = DATE_HINT_REGEX.search(text) if text else None
+    if not m:
         return None
-    dt = dateparser.parse(
-        text, languages=["es"],
-        settings={
-            "TIMEZONE": "Europe/Madrid",
-            "RETURN_AS_TIMEZONE_AWARE": True,
-            "PREFER_DATES_FROM": "future",
-        },
-    )
+    # solo una ventana alrededor de la fecha (la hora suele ir justo antes o
+    # después); normalizada para que fechas iguales compartan entrada en caché
+    window = text[max(0, m.start() - 40):m.end() + 80]
+    return _parse_datetime_es(clean_line(window))
+
+# muchas tarjetas repiten la misma fecha; los datetime son inmutables
+@lru_cache(maxsize=4096)
+def _parse_datetime_es(text: str):
+    dt = DATE_PARSER.get_date_data(text).date_obj
     if dt:
         return dt
     m = DATE_REGEX.search(text)
@@ -96,67 +321,58 @@ def extract_datetime_es(text: str):
         return None
     tm = TIME_REGEX.search(text)
     hour, minute = (DEFAULT_TIME if not tm else (int(tm.group(1)), int(tm.group(2))))
-    import datetime as _dt
-    dt_naive = _dt.datetime(year, month, day, hour, minute)
+    dt_naive = datetime(year, month, day, hour, minute)
     return dt_naive.replace(tzinfo=DEFAULT_TZ)
 
 def clean_line(s: str) -> str:
-    s = s.strip()
     # normaliza espacios
-    s = re.sub(r"\s+", " ", s)
-    return s
-
-def looks_like_noise(s: str) -> bool:
-    t = s.strip().lower()
-    if not t:
-        return True
-    if any(t.startswith(p) for p in NOISE_PREFIXES):
-        return True
-    if any(w in t for w in ("aceptar todas", "personalizar", "rechazar", "uso de cookies")):
-        return True
-    return False
+    return WS_REGEX.sub(" ", s).strip()
 
 def looks_like_venue(s: str) -> bool:
-    t = s.strip().lower()
-    return any(v in t for v in VENUE_WORDS)
+    return bool(VENUE_REGEX.search(s))
 
 def first_title_like_line(lines: list[str]) -> str | None:
     for line in lines:
         c = clean_line(line)
-        if looks_like_noise(c):
-            continue
-        # evita que coja el recinto como título
-        if looks_like_venue(c):
-            continue
-        # evita líneas que son solo fecha/hora
-        if DATE_REGEX.search(c):
-            continue
-        if TIME_REGEX.search(c) and len(c) <= 8:
+        # descarta ruido, el recinto y líneas que son solo fecha/hora;
+        # el título tiene que tener letras
+        if (
+            not c
+            or NOISE_REGEX.search(c)
+            or VENUE_REGEX.search(c)
+            or DATE_REGEX.search(c)
+            or (len(c) <= 8 and TIME_REGEX.search(c))
+            or not LETTER_REGEX.search(c)
+        ):
             continue
-        # algo con letras
-        if re.search(r"[A-Za-zÁÉÍÓÚáéíóúÜüÑñ]", c):
-            return c
+        return c
     return None
 
 # -----------------------
 # Scraper (desde listado)
 # -----------------------
+def canonical_page_url(url: str) -> str:
+    # "?page=0" es la propia agenda y los #fragmentos no cambian de página
+    p = urlparse(urldefrag(url).url)
+    query = [(k, v) for k, v in parse_qsl(p.query, keep_blank_values=True) if (k, v) != ("page", "0")]
+    return urlunparse(p._replace(query=urlencode(query)))
+
 def parse_list_page_to_events(html: str, base_url: str) -> list[dict]:
-    soup = BeautifulSoup(html, "lxml")
-    cards = soup.select("article, .views-row, .event, .node--type-event, .card, .node, .teaser")
+    cards = select(parse_html(html), CARD_SELECTOR)
     events = []
     for card in cards:
         # recojo todas las líneas de texto visibles de la tarjeta
-        lines = [t for t in card.stripped_strings]
+        lines = node_lines(card)
         if not lines:
             continue
-        # título heurístico
-        title = first_title_like_line(lines) or "Evento"
-        # fecha/hora del bloque completo
+        # fecha/hora del bloque completo; primero, para no buscar título ni
+        # recinto en tarjetas sin fecha (banners, menús...)
         block_text = clean_line(" ".join(lines))
         start_dt = extract_datetime_es(block_text)
         if not start_dt:
             continue
+        # título heurístico
+        title = first_title_like_line(lines) or "Evento"
         # venue por heurística
         venue = None
         for line in lines:
@@ -167,9 +383,9 @@ def parse_list_page_to_events(html: str, base_url: str) -> list[dict]:
 
         # url: mejor algún enlace válido si existe (aunque sea “+ info”)
         href = None
-        for a in card.select("a[href]"):
-            href = urljoin(base_url, a.get("href"))
-            break
+        a = select_first(card, LINK_SELECTOR)
+        if a is not None:
+            href = urljoin(base_url, node_attr(a, "href"))
 
         events.append({
             "title": title,
@@ -183,73 +399,114 @@ def parse_list_page_to_events(html: str, base_url: str) -> list[dict]:
         print(f"Evento encontrado: {title} | {start_dt} | {venue}")
     return events
 
-def scrape_all_events() -> list[dict]:
+async def scrape_all_events() -> list[dict]:
     all_events = []
-    with Browser() as session:
+    async with Browser() as session, static_session() as client:
+        # todas las páginas: HTML estático primero, Chromium solo si hace falta
+        fetch = partial(fetch_listing, client, session)
         # página 1
-        first_html = session.get_html(AGENDA_URL)
-        os.makedirs(OUTPUT_DIR, exist_ok=True)
-        with open(os.path.join(OUTPUT_DIR, "debug.html"), "w", encoding="utf-8") as f:
-            f.write(first_html)
-        print("✅ Guardado public/debug.html con la agenda descargada")
-
-        # páginas siguientes (?page=, rel=next)
-        soups = [BeautifulSoup(first_html, "lxml")]
-        page_urls = [AGENDA_URL]
-        for a in soups[0].select("a[href*='?page='], a[rel='next']"):
-            page_urls.append(urljoin(AGENDA_URL, a.get("href")))
+        first_html = await cached_get(AGENDA_URL, fetch)
+        if os.environ.get("SCRAPER_DEBUG"):
+            os.makedirs(OUTPUT_DIR, exist_ok=True)
+            Path(OUTPUT_DIR, "debug.html").write_bytes(first_html.encode("utf-8"))
+            print("✅ Guardado public/debug.html con la agenda descargada")
+
+        # páginas siguientes (?page=); el paginador repite hrefs (número,
+        # "siguiente", "última"): se deduplican en crudo antes de urljoin/urlparse
+        hrefs = dict.fromkeys(unescape(m.group(1)) for m in PAGER_REGEX.finditer(first_html))
+        page_urls = [AGENDA_URL] + [canonical_page_url(urljoin(AGENDA_URL, h)) for h in hrefs]
+        # dedupe antes de recortar, para no gastar MAX_PAGES en repetidas
         page_urls = list(dict.fromkeys(page_urls))[:MAX_PAGES]
 
-        for i, url in enumerate(page_urls, start=1):
-            html = first_html if i == 1 else session.get_html(url)
-            evs = parse_list_page_to_events(html, url)
-            print(f"Página {i}: {len(evs)} eventos")
-            all_events.extend(evs)
+        # el resto de páginas se descargan a la vez; cada una se parsea en un
+        # hilo en cuanto llega, sin bloquear el event loop (la página 1, mientras
+        # se descargan las demás)
+        async def fetch_and_parse(url: str) -> list[dict]:
+            html = await cached_get(url, fetch)
+            return await asyncio.to_thread(parse_list_page_to_events, html, url)
+
+        pages = await asyncio.gather(
+            asyncio.to_thread(parse_list_page_to_events, first_html, AGENDA_URL),
+            *(fetch_and_parse(u) for u in page_urls[1:]),
+        )
+
+    for i, evs in enumerate(pages, start=1):
+        print(f"Página {i}: {len(evs)} eventos")
+        all_events.extend(evs)
 
-    # dedupe por (título + fecha)
-    seen, uniq = set(), []
+    # dedupe por (título + fecha); el timestamp se hashea mucho más barato
+    # que un datetime con tzinfo y representa el mismo instante
+    # (un solo dict con orden de inserción; se queda la primera aparición)
+    uniq = {}
     for ev in all_events:
-        key = (ev["title"], ev["start_dt"])
-        if key in seen: 
-            continue
-        seen.add(key); uniq.append(ev)
-    return uniq
+        uniq.setdefault((ev["title"], ev["start_dt"].timestamp()), ev)
+    return list(uniq.values())
 
 # -----------------------
 # ICS
 # -----------------------
-def build_ics(events: list[dict]) -> Calendar:
-    cal = Calendar()
-    cal.events = set()
+def ics_escape(s: str | None) -> str:
+    # TEXT de RFC 5545
+    return (s or "").replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,").replace("\n", "\\n")
+
+def fold_line(line: str) -> str:
+    # RFC 5545: máx. 75 octetos por línea; se continúa con CRLF + espacio
+    if len(line.encode("utf-8")) <= 75:
+        return line + "\r\n"
+    parts, cur, size = [], [], 0
+    for ch in line:
+        n = len(ch.encode("utf-8"))
+        if size + n > 75:
+            parts.append("".join(cur))
+            cur, size = [" "], 1
+        cur.append(ch)
+        size += n
+    parts.append("".join(cur))
+    return "\r\n".join(parts) + "\r\n"
+
+def render_ics(events: list[dict]) -> str:
+    stamp = datetime.now(tz.UTC).strftime(ICS_DT_FORMAT)
+    out = [
+        "BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//PalauClub//ES\r\n",
+        fold_line(f"X-WR-CALNAME:{ics_escape(CAL_NAME)}"),
+    ]
     for ev in events:
-        e = Event()
-        e.name = ev["title"]
-        e.begin = ev["start_dt"]
-        e.location = ev.get("location")
-        e.url = ev.get("url")
-        e.description = ev.get("description")
         uid_src = ev.get("url") or (ev["title"] + str(ev["start_dt"]))
-        e.uid = hashlib.sha1(uid_src.encode("utf-8")).hexdigest() + "@palausantjordi"
-        cal.events.add(e)
-    cal.extra.append(ContentLine(name="X-WR-CALNAME", params={}, value=CAL_NAME))
-    return cal
+        uid = hashlib.blake2b(uid_src.encode("utf-8"), digest_size=20).hexdigest() + UID_SUFFIX
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:{uid}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{ev['start_dt'].astimezone(tz.UTC).strftime(ICS_DT_FORMAT)}",
+            f"SUMMARY:{ics_escape(ev['title'])}",
+        ]
+        if ev.get("location"):
+            lines.append(f"LOCATION:{ics_escape(ev['location'])}")
+        if ev.get("url"):
+            lines.append(f"URL:{ev['url']}")
+        if ev.get("description"):
+            lines.append(f"DESCRIPTION:{ics_escape(ev['description'])}")
+        lines.append("END:VEVENT")
+        out.extend(map(fold_line, lines))
+    out.append("END:VCALENDAR\r\n")
+    return "".join(out)
 
 # -----------------------
 # Main
 # -----------------------
 def main():
     os.makedirs(OUTPUT_DIR, exist_ok=True)
-    events = scrape_all_events()
+    events = asyncio.run(scrape_all_events())
     print(f"🔎 Total eventos detectados: {len(events)}")
 
     if not events:
         print("⚠️ No se encontraron eventos; no se generará el .ics")
         return
 
-    cal = build_ics(events)
-    with open(OUTPUT_PATH, "w", encoding="utf-8") as f:
-        f.writelines(cal)
-    print(f"✅ Generado {OUTPUT_PATH} con {len(list(cal.events))} eventos")
+    # una sola escritura, en binario: el CRLF de RFC 5545 va tal cual
+    with open(OUTPUT_PATH, "wb") as f:
+        f.write(render_ics(events).encode("utf-8"))
+    print(f"✅ Generado {OUTPUT_PATH} con {len(events)} eventos")
 
 if __name__ == "__main__":
     main()